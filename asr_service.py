@@ -1,13 +1,19 @@
 import asyncio
 import aiohttp
-import json
+import functools
 import struct
 import gzip
 import uuid
+import zlib
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+# zlib解压gzip格式数据，跳过gzip模块的Python包装层
+_GZIP_WBITS = 31
+
 class ProtocolVersion:
     V1 = 0b0001
 
@@ -27,6 +33,7 @@ class SerializationType:
     JSON = 0b0001
 
 class CompressionType:
+    NO_COMPRESSION = 0b0000
     GZIP = 0b0001
 
 class AsrRequestHeader:
@@ -45,6 +52,10 @@ class AsrRequestHeader:
         self.message_type_specific_flags = flags
         return self
 
+    def with_compression_type(self, compression_type: int):
+        self.compression_type = compression_type
+        return self
+
     def to_bytes(self) -> bytes:
         header = bytearray()
         header.append((ProtocolVersion.V1 << 4) | 1)
@@ -53,14 +64,84 @@ class AsrRequestHeader:
         header.extend(self.reserved_data)
         return bytes(header)
 
+# 请求头只有三种取值，模块加载时预先生成，避免每个音频包重复构造
+_HEADER_FULL = AsrRequestHeader().to_bytes()
+_HEADER_POS = AsrRequestHeader() \
+    .with_message_type(MessageType.CLIENT_AUDIO_ONLY_REQUEST) \
+    .with_message_type_specific_flags(MessageTypeSpecificFlags.POS_SEQUENCE) \
+    .to_bytes()
+_HEADER_NEG = AsrRequestHeader() \
+    .with_message_type(MessageType.CLIENT_AUDIO_ONLY_REQUEST) \
+    .with_message_type_specific_flags(MessageTypeSpecificFlags.NEG_WITH_SEQUENCE) \
+    .to_bytes()
+# 不压缩音频时使用的请求头(compression位为0)
+_HEADER_POS_RAW = AsrRequestHeader() \
+    .with_message_type(MessageType.CLIENT_AUDIO_ONLY_REQUEST) \
+    .with_message_type_specific_flags(MessageTypeSpecificFlags.POS_SEQUENCE) \
+    .with_compression_type(CompressionType.NO_COMPRESSION) \
+    .to_bytes()
+_HEADER_NEG_RAW = AsrRequestHeader() \
+    .with_message_type(MessageType.CLIENT_AUDIO_ONLY_REQUEST) \
+    .with_message_type_specific_flags(MessageTypeSpecificFlags.NEG_WITH_SEQUENCE) \
+    .with_compression_type(CompressionType.NO_COMPRESSION) \
+    .to_bytes()
+# seq(有符号) + payload size(无符号)
+_SEQ_LEN = struct.Struct('>iI')
+# 响应的4字节头
+_HDR = struct.Struct('>BBBB')
+
+# 静音帧判断：int16 PCM峰值低于阈值视为静音，每N个静音帧仍保留1个以便ASR断句
+SILENCE_THRESHOLD = 500
+KEEP_EVERY_N = 10
+
+def pcm_peak(audio_data: bytes) -> int:
+    """返回16bit PCM音频的最大振幅"""
+    # audioop在Python 3.13中已移除，使用memoryview按int16解析
+    samples = memoryview(audio_data)[:len(audio_data) & ~1].cast('h')
+    if not samples:
+        return 0
+    return max(max(samples), -min(samples))
+
+@functools.lru_cache(maxsize=16)
+def _build_full_payload(uid: str, compresslevel: int) -> bytes:
+    """初始化请求的payload只与uid有关，按uid缓存压缩后的结果"""
+    payload = {
+        "user": {"uid": uid},
+        "audio": {
+            "format": "pcm",
+            "rate": 16000,
+            "bits": 16,
+            "channel": 1
+        },
+        "request": {
+            "model_name": "bigmodel",
+            "enable_itn": True,
+            "enable_punc": True,
+            "show_utterances": True
+        }
+    }
+    return gzip.compress(orjson.dumps(payload), compresslevel=compresslevel)
+
 class AsrClient:
-    def __init__(self, app_key: str, access_key: str, session: aiohttp.ClientSession):
+    def __init__(self, app_key: str, access_key: str, session: aiohttp.ClientSession,
+                 compress_audio: bool = True, pending_bytes_target: int = 32000,
+                 flush_interval: float = 0.5):
         self.app_key = app_key
         self.access_key = access_key
         self.session = session
         self.url = "wss://openspeech.bytedance.com/api/v3/sauc/bigmodel"
         self.ws = None
         self.seq = 1
+        # PCM音频压缩率很低，使用最快的压缩级别；compress_audio=False时直接发送原始PCM
+        self.compress_audio = compress_audio
+        self._compressor_level = 1
+        # 合并多个PCM小包后再发送，减少WebSocket帧数；默认约1s音频(16k*16bit)
+        self._pending = bytearray()
+        self._pending_bytes_target = pending_bytes_target
+        self._flush_interval = flush_interval
+        self._flush_handle = None
+        self._lock = asyncio.Lock()
+        self._silence_frames = 0
 
     def _build_auth_headers(self):
         reqid = str(uuid.uuid4())
@@ -72,56 +153,31 @@ class AsrClient:
         }
 
     def _build_full_request(self, uid: str) -> bytes:
-        header = AsrRequestHeader()
-        payload = {
-            "user": {"uid": uid},
-            "audio": {
-                "format": "pcm",
-                "rate": 16000,
-                "bits": 16,
-                "channel": 1
-            },
-            "request": {
-                "model_name": "bigmodel",
-                "enable_itn": True,
-                "enable_punc": True,
-                "show_utterances": True
-            }
-        }
-        payload_bytes = json.dumps(payload).encode('utf-8')
-        compressed_payload = gzip.compress(payload_bytes)
-        request = bytearray()
-        request.extend(header.to_bytes())
-        request.extend(struct.pack('>i', self.seq))
-        request.extend(struct.pack('>I', len(compressed_payload)))
-        request.extend(compressed_payload)
-        return bytes(request)
+        compressed_payload = _build_full_payload(uid, self._compressor_level)
+        return b''.join((_HEADER_FULL, _SEQ_LEN.pack(self.seq, len(compressed_payload)), compressed_payload))
 
     def _build_audio_request(self, audio_data: bytes, is_last: bool = False) -> bytes:
-        header = AsrRequestHeader()
-        seq = self.seq
         if is_last:
-            header.with_message_type_specific_flags(MessageTypeSpecificFlags.NEG_WITH_SEQUENCE)
-            seq = -seq
+            header = _HEADER_NEG if self.compress_audio else _HEADER_NEG_RAW
+            seq = -self.seq
         else:
-            header.with_message_type_specific_flags(MessageTypeSpecificFlags.POS_SEQUENCE)
-        header.with_message_type(MessageType.CLIENT_AUDIO_ONLY_REQUEST)
-        
-        request = bytearray()
-        request.extend(header.to_bytes())
-        request.extend(struct.pack('>i', seq))
-        compressed_audio = gzip.compress(audio_data)
-        request.extend(struct.pack('>I', len(compressed_audio)))
-        request.extend(compressed_audio)
-        return bytes(request)
+            header = _HEADER_POS if self.compress_audio else _HEADER_POS_RAW
+            seq = self.seq
+        if self.compress_audio:
+            audio_data = gzip.compress(audio_data, compresslevel=self._compressor_level)
+        return b''.join((header, _SEQ_LEN.pack(seq, len(audio_data)), audio_data))
 
     def _parse_response(self, msg: bytes) -> dict:
-        header_size = msg[0] & 0x0f
-        message_type = msg[1] >> 4
-        message_type_specific_flags = msg[1] & 0x0f
-        serialization_method = msg[2] >> 4
-        message_compression = msg[2] & 0x0f
-        payload = msg[header_size*4:]
+        b0, b1, b2, _ = _HDR.unpack_from(msg, 0)
+        message_type = b1 >> 4
+        message_type_specific_flags = b1 & 0x0f
+        serialization_method = b2 >> 4
+        message_compression = b2 & 0x0f
+        # 协议固定为4字节头(header_size=1)，其他取值按声明长度兼容处理
+        offset = 4
+        if b0 & 0x0f != 1:
+            logger.warning(f"ASR响应头长度异常: header_size={b0 & 0x0f}")
+            offset = (b0 & 0x0f) * 4
         
         result = {
             "code": 0,
@@ -130,25 +186,27 @@ class AsrClient:
         }
         
         if message_type_specific_flags & 0x01:
-            payload = payload[4:]
+            offset += 4
         if message_type_specific_flags & 0x02:
             result["is_last"] = True
         if message_type_specific_flags & 0x04:
-            payload = payload[4:]
+            offset += 4
             
         if message_type == MessageType.SERVER_FULL_RESPONSE:
-            payload = payload[4:]
+            offset += 4
         elif message_type == MessageType.SERVER_ERROR_RESPONSE:
-            result["code"] = struct.unpack('>i', payload[:4])[0]
-            payload = payload[8:]
+            result["code"], _ = _SEQ_LEN.unpack_from(msg, offset)
+            offset += 8
+        # memoryview切片不复制数据，gzip/orjson均可直接接收
+        payload = memoryview(msg)[offset:]
             
         if payload:
             try:
                 if message_compression == CompressionType.GZIP:
-                    payload = gzip.decompress(payload)
+                    payload = zlib.decompress(payload, wbits=_GZIP_WBITS)
                 
                 if serialization_method == SerializationType.JSON:
-                    data = json.loads(payload.decode('utf-8'))
+                    data = orjson.loads(payload)
                     result["code"] = data.get("code", 20000000)
                     if "result" in data:
                         result["text"] = data["result"].get("text", "")
@@ -178,14 +236,52 @@ class AsrClient:
             logger.warning("音频数据为空，跳过发送")
             return
         
-        request = self._build_audio_request(audio_data, is_last=False)
+        if pcm_peak(audio_data) < SILENCE_THRESHOLD:
+            self._silence_frames += 1
+            if self._silence_frames < KEEP_EVERY_N:
+                return
+            self._silence_frames = 0
+        
+        async with self._lock:
+            self._pending.extend(audio_data)
+            if len(self._pending) >= self._pending_bytes_target:
+                await self._flush_pending()
+            elif self._flush_handle is None and self._flush_interval > 0:
+                # 音频不足目标大小时，最多等待flush_interval秒后发送
+                loop = asyncio.get_running_loop()
+                self._flush_handle = loop.call_later(self._flush_interval, self._on_flush_timer)
+
+    async def _flush_pending(self):
+        """发送缓存的音频，调用方需持有self._lock"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        request = self._build_audio_request(bytes(self._pending), is_last=False)
+        size = len(self._pending)
+        self._pending.clear()
         await self.ws.send_bytes(request)
-        logger.debug(f"ASR发送seq={self.seq}, size={len(audio_data)}")
+        logger.debug(f"ASR发送seq={self.seq}, size={size}")
         self.seq += 1
 
+    def _on_flush_timer(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self._timed_flush())
+
+    async def _timed_flush(self):
+        try:
+            async with self._lock:
+                await self._flush_pending()
+        except Exception as e:
+            logger.error(f"ASR定时发送音频失败: {e}")
+
     async def send_end(self):
-        request = self._build_audio_request(b'', is_last=True)
-        await self.ws.send_bytes(request)
+        async with self._lock:
+            await self._flush_pending()
+            request = self._build_audio_request(b'', is_last=True)
+            await self.ws.send_bytes(request)
         logger.info("ASR end signal sent")
 
     async def receive_results(self):
@@ -208,6 +304,9 @@ class AsrClient:
                 break
 
     async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
         if self.ws and not self.ws.closed:
             await self.ws.close()
 
@@ -1,7 +1,8 @@
 import aiohttp
-import json
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
 class LLMClient:
@@ -39,21 +40,32 @@ class LLMClient:
         logger.info(f"Calling LLM, history length: {len(self.messages)}")
         
         full_response = ""
-        async with self.session.post(self.url, headers=headers, json=data) as resp:
-            async for line in resp.content:
-                line_str = line.decode('utf-8').strip()
-                if line_str.startswith('data: '):
-                    line_str = line_str[6:]
-                    if line_str == '[DONE]':
+        async with self.session.post(self.url, headers=headers, data=orjson.dumps(data)) as resp:
+            # 按块读取后自行按换行切分，避免逐行readuntil的开销；不完整的行留在buf中
+            buf = b''
+            done = False
+            async for data in resp.content.iter_any():
+                buf += data
+                *lines, buf = buf.split(b'\n')
+                for line in lines:
+                    # 直接在bytes上判断，orjson可直接解析bytes，无需逐行decode
+                    line = line.strip()
+                    if not line.startswith(b'data: '):
+                        continue
+                    body = line[6:]
+                    if body == b'[DONE]':
+                        done = True
                         break
                     try:
-                        chunk = json.loads(line_str)
+                        chunk = orjson.loads(body)
                         delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
                         if delta:
                             full_response += delta
                             yield delta
                     except:
                         pass
+                if done:
+                    break
         
         if full_response:
             self.add_assistant_message(full_response)
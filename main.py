@@ -1,11 +1,13 @@
-import base64
+import asyncio
+import functools
 import json
 import logging
 import os
-from typing import List
+import re
 
 import aiohttp
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import orjson
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
@@ -32,11 +34,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class VoiceInfo(BaseModel):
-    voice_name: str
-    voice_code: str
-    choose: bool
-
 class ToyConfigSave(BaseModel):
     toy_name: str
     voice_code: str
@@ -44,53 +41,68 @@ class ToyConfigSave(BaseModel):
 
 toy_name: str = ""
 voice_id: str = config.TTS_VOICE_TYPE
-voices: List[VoiceInfo] = []
+# 音色列表快照({voice_name, voice_code, choose})，修改时整体替换，读取方无需加锁
+voices_snapshot: tuple[dict, ...] = ()
 toy_prompt: str = ""
+# /api/toy/info 的响应体缓存，配置加载/保存时刷新
+_toy_info_cache: bytes = b"{}"
+
+# 二进制消息首字节标识消息类型，后跟原始数据
+FRAME_TTS = b'\x01'
 
 # 按标点切割文本
 # 核心作用：LLM 生成的文本过长时，按标点符号切割成短句，避免 TTS 合成超长音频（提升实时性）；
 # 优先在目标长度（默认 50 字）附近找标点，保证句子完整性。
+_PUNCT = "。！？；，.!?;,"
+_PUNCT_RE = re.compile(f"[{re.escape(_PUNCT)}]")
+
 def find_nearest_punctuation(text: str, target_len: int = 50):
     """在目标长度附近查找标点符号位置"""
-    punctuations = ['。', '！', '？', '；', '，', '.', '!', '?', ';', ',']
-    
     if len(text) <= target_len:
         return len(text) - 1
     
     search_start = max(0, target_len - 20)
     search_end = min(len(text), target_len + 20)
     
-    for i in range(target_len, search_end):
-        if i < len(text) and text[i] in punctuations:
-            return i
+    # 向后查找：正则在C层扫描 [target_len, search_end)
+    match = _PUNCT_RE.search(text, target_len, search_end)
+    if match:
+        return match.start()
     
-    for i in range(target_len, search_start - 1, -1):
-        if i < len(text) and text[i] in punctuations:
-            return i
+    # 向前查找：取 [search_start, target_len] 内最后一个标点
+    pos = max(text.rfind(c, search_start, target_len + 1) for c in _PUNCT)
+    if pos >= 0:
+        return pos
     
     return min(target_len, len(text) - 1)
 
+# 短句切割阈值：新到达的LLM片段中出现标点且累计不少于30字时切割；
+# 超过100字仍无标点时，回退到find_nearest_punctuation强制切割
+MIN_SENTENCE_LEN = 30
+MAX_BUFFER_LEN = 100
+
+def find_last_punctuation(text: str) -> int:
+    """返回text中最后一个标点符号的位置，没有则返回-1"""
+    return max(text.rfind(c) for c in _PUNCT)
+
+@functools.lru_cache(maxsize=1)
 def get_project_root():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     return current_dir
 
 
-def load_prompt(file_name: str) -> str:
-    """加载纯文本提示词，无变量"""
-    project_root = get_project_root()
-    file_path = os.path.join(project_root, "prompts", file_name)
-    print(f"正在加载智能体提示词文件：{file_path}")
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except Exception as e:
-        error_msg = f"[智能体-提示词加载失败] 原因：{str(e)}"
-        print(error_msg)
-        return error_msg
+def refresh_toy_info_cache():
+    """重新序列化 /api/toy/info 的响应体"""
+    global _toy_info_cache
+    _toy_info_cache = orjson.dumps({
+        "toy_name": toy_name,
+        "voices": voices_snapshot,
+        "toy_prompt": toy_prompt
+    })
 
 def load_toy_config():
     """加载手办配置"""
-    global toy_name, voice_id, voices, toy_prompt
+    global toy_name, voice_id, voices_snapshot, toy_prompt
     project_root = get_project_root()
     
     try:
@@ -113,16 +125,17 @@ def load_toy_config():
                     if len(parts) >= 2:
                         code = parts[0].strip()
                         name = parts[1].strip()
-                        voices.append(VoiceInfo(
-                            voice_name=name,
-                            voice_code=code,
-                            choose=(idx == 0)
-                        ))
+                        voices.append({
+                            "voice_name": name,
+                            "voice_code": code,
+                            "choose": idx == 0
+                        })
                         if idx == 0:
                             voice_id = code
+            voices_snapshot = tuple(voices)
     except Exception as e:
         logger.error(f"加载voice_id.txt失败: {e}")
-        voices = []
+        voices_snapshot = ()
     
     try:
         prompt_path = os.path.join(project_root, "prompts", "character_setting_prompt.txt")
@@ -132,11 +145,12 @@ def load_toy_config():
         logger.error(f"加载character_setting_prompt.txt失败: {e}")
         toy_prompt = ""
     
-    logger.info(f"配置加载完成: toy_name={toy_name}, voices={len(voices)}个, prompt长度={len(toy_prompt)}")
+    refresh_toy_info_cache()
+    logger.info(f"配置加载完成: toy_name={toy_name}, voices={len(voices_snapshot)}个, prompt长度={len(toy_prompt)}")
 
 def save_toy_config(config: ToyConfigSave):
     """保存手办配置"""
-    global toy_name, voice_id, toy_prompt
+    global toy_name, voice_id, voices_snapshot, toy_prompt
     project_root = get_project_root()
     
     try:
@@ -150,8 +164,9 @@ def save_toy_config(config: ToyConfigSave):
     
     try:
         voice_id = config.voice_code
-        for v in voices:
-            v.choose = (v.voice_code == config.voice_code)
+        voices_snapshot = tuple(
+            {**v, "choose": v["voice_code"] == config.voice_code} for v in voices_snapshot
+        )
     except Exception as e:
         logger.error(f"更新voice_id失败: {e}")
         raise
@@ -165,6 +180,7 @@ def save_toy_config(config: ToyConfigSave):
         logger.error(f"保存character_setting_prompt.txt失败: {e}")
         raise
     
+    refresh_toy_info_cache()
     logger.info(f"配置保存成功: toy_name={toy_name}, voice_code={voice_id}")
 
 @app.on_event("startup")
@@ -173,16 +189,13 @@ async def startup_event():
 
 @app.get("/api/toy/info")
 async def get_toy_info():
-    return {
-        "toy_name": toy_name,
-        "voices": [v.model_dump() for v in voices],
-        "toy_prompt": toy_prompt
-    }
+    return Response(content=_toy_info_cache, media_type="application/json")
 
 @app.post("/api/toy/save")
 async def save_toy_info(config: ToyConfigSave):
     try:
-        save_toy_config(config)
+        # 文件写入放到线程中执行，避免阻塞事件循环上的其他WebSocket会话
+        await asyncio.to_thread(save_toy_config, config)
         return {"success": True, "message": "保存成功"}
     except Exception as e:
         logger.error(f"保存配置失败: {e}")
@@ -198,6 +211,8 @@ async def websocket_voice_chat(websocket: WebSocket):
     # 初始化http-session会话、ASR/TTS/LLM客户端示例的初始化，以及ASR技术的结果缓存
     session = None
     asr_client = None
+    # 后台预先建立的下一轮ASR连接
+    next_asr_task = None
     tts_client = None
     llm_client = None
     asr_result = ""
@@ -208,8 +223,8 @@ async def websocket_voice_chat(websocket: WebSocket):
         # 初始化LLM客户端(配置API密钥、模型、会话)
         llm_client = LLMClient(config.DOUBAO_API_KEY, config.DOUBAO_MODEL, session)
         # 设置LLM系统提示：要求回答简洁(<=50字)
-        character_setting_prompt = load_prompt("character_setting_prompt.txt")
-        default_prompt = character_setting_prompt if character_setting_prompt else "你是豆包，是由字节跳动开发的AI助手，回答要简洁，不要超过50个字"
+        # 使用启动时加载、保存配置时更新的全局提示词，避免每个连接都读取文件
+        default_prompt = toy_prompt if toy_prompt else "你是豆包，是由字节跳动开发的AI助手，回答要简洁，不要超过50个字"
         llm_client.add_system_message(default_prompt)
 
         while True:
@@ -261,6 +276,13 @@ async def websocket_voice_chat(websocket: WebSocket):
                             async for text in asr_client.receive_results():
                                 # 接收ASR最终识别文本
                                 asr_result = text
+                            # 本轮识别已结束，后台预先建立下一轮的ASR连接，与LLM/TTS并行进行握手
+                            await asr_client.close()
+                            next_asr_task = asyncio.create_task(AsrClient(
+                                config.ASR_APP_KEY,
+                                config.ASR_ACCESS_KEY,
+                                session
+                            ).connect())
 
                             # 向客户端返回ASR结果
                             await websocket.send_json({"type": "asr", "data": asr_result})
@@ -269,12 +291,9 @@ async def websocket_voice_chat(websocket: WebSocket):
                             # 处理空ASR结果（无有效语音）
                             if not asr_result:
                                 await websocket.send_text("over") # 通知客户端结束
-                                # 重置ASR客户端，准备下一次语音输入
-                                asr_client = await AsrClient(
-                                    config.ASR_APP_KEY,
-                                    config.ASR_ACCESS_KEY,
-                                    session
-                                ).connect()
+                                # 切换到预先建立的ASR连接，准备下一次语音输入
+                                asr_client = await next_asr_task
+                                next_asr_task = None
                                 asr_result = ""
                                 continue
                             
@@ -300,45 +319,74 @@ async def websocket_voice_chat(websocket: WebSocket):
                                 # 流式合成语音(逐块获取音频数据)
                                 async for audio_chunk in tts_client.synthesize(text):
                                     chunk_count += 1
-                                    # 将音频二进制数据base64编码后发送给客户端
-                                    await websocket.send_json({
-                                        "type": "tts",
-                                        "data": base64.b64encode(audio_chunk).decode()
-                                    })
+                                    # 音频以二进制帧发送给客户端(首字节为类型标识)，避免base64膨胀
+                                    await websocket.send_bytes(FRAME_TTS + audio_chunk)
                                 logger.info(f"TTS完成: {chunk_count}个音频块")
 
-                            # 流式调用LLM生成回答
-                            async for llm_chunk in llm_client.generate_stream(asr_result):
-                                # 累加LLM生成的文本片段
-                                llm_buffer += llm_chunk
-                                logger.info(f"LLM块: '{llm_chunk}' (累计{len(llm_buffer)}字)")
-                                # 向客户端返回累计的LLM文本(前端可实时展示)
-                                await websocket.send_json({"type": "llm", "data": llm_buffer})
-
-                                # 缓存文本超过100字时，切割短句进行TTS合成
-                                if len(llm_buffer) > 100:
-                                    cut_pos = find_nearest_punctuation(llm_buffer, 50)
+                            # TTS合成与LLM流式生成并行：LLM切割出的句子放入队列，由独立任务依次合成
+                            # 队列有界，TTS处理不过来时LLM读取自然等待
+                            sentence_q = asyncio.Queue(maxsize=4)
+
+                            async def tts_consumer():
+                                error = None
+                                while True:
+                                    sentence = await sentence_q.get()
+                                    if sentence is None:
+                                        break
+                                    # 合成出错后继续取空队列，避免LLM侧put阻塞
+                                    if error is None:
+                                        try:
+                                            await synthesize_and_send(sentence)
+                                        except Exception as e:
+                                            error = e
+                                if error is not None:
+                                    raise error
+
+                            tts_task = asyncio.create_task(tts_consumer())
+
+                            try:
+                                # 流式调用LLM生成回答
+                                async for llm_chunk in llm_client.generate_stream(asr_result):
+                                    # 累加LLM生成的文本片段
+                                    llm_buffer += llm_chunk
+                                    logger.info(f"LLM块: '{llm_chunk}' (累计{len(llm_buffer)}字)")
+                                    # 只向客户端返回新增的LLM文本，由前端自行拼接展示
+                                    await websocket.send_json({"type": "llm_delta", "data": llm_chunk})
+
+                                    # 只在新到达的片段中查找标点，避免重复扫描整个缓存
+                                    cut_pos = find_last_punctuation(llm_chunk)
+                                    if cut_pos >= 0:
+                                        cut_pos += len(llm_buffer) - len(llm_chunk)
+                                    if cut_pos + 1 < MIN_SENTENCE_LEN:
+                                        # 缓存文本超过100字仍无合适标点时，强制切割
+                                        if len(llm_buffer) <= MAX_BUFFER_LEN:
+                                            continue
+                                        cut_pos = find_nearest_punctuation(llm_buffer, 50)
                                     # 切割出完整句子
                                     sentence = llm_buffer[:cut_pos+1]
                                     # 剩余文本继续缓存
                                     llm_buffer = llm_buffer[cut_pos+1:]
-                                    # 合成并发送语音
-                                    await synthesize_and_send(sentence)
+                                    # 交给TTS任务合成并发送语音
+                                    await sentence_q.put(sentence)
+
+                                # LLM生成结束后，处理剩余的缓存文本
+                                if llm_buffer:
+                                    await sentence_q.put(llm_buffer)
 
-                            # LLM生成结束后，处理剩余的缓存文本
-                            if llm_buffer:
-                                await synthesize_and_send(llm_buffer)
+                                # 通知TTS任务结束，并等待剩余句子合成完成
+                                await sentence_q.put(None)
+                                await tts_task
+                            finally:
+                                if not tts_task.done():
+                                    tts_task.cancel()
 
                             # 通知客户端本轮对话结束
                             await websocket.send_text("over")
                             logger.info("=== 完成 ===")
 
-                            # 重置ASR客户端，准备下一轮语音输入
-                            asr_client = await AsrClient(
-                                config.ASR_APP_KEY,
-                                config.ASR_ACCESS_KEY,
-                                session
-                            ).connect()
+                            # 切换到预先建立的ASR连接，准备下一轮语音输入
+                            asr_client = await next_asr_task
+                            next_asr_task = None
                             asr_result = ""
                 # 处理客户端断开连接
                 elif message["type"] == "websocket.disconnect":
@@ -357,12 +405,23 @@ async def websocket_voice_chat(websocket: WebSocket):
         # 都关闭 ASR/TTS 连接和 aiohttp 会话，避免资源泄漏。
         if asr_client:
             await asr_client.close()
+        if next_asr_task:
+            if next_asr_task.done() and not next_asr_task.cancelled() and next_asr_task.exception() is None:
+                await next_asr_task.result().close()
+            else:
+                next_asr_task.cancel()
         if tts_client:
             await tts_client.close()
         if session and not session.closed:
             await session.close()
 
 # ASR + LLM + TTS服务使用8001端口
+# 优先使用uvloop事件循环(Windows不支持uvloop，回退到asyncio)
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    uvicorn.run(app, host="0.0.0.0", port=8001, loop=loop, http="httptools")
@@ -1,12 +1,24 @@
 import aiohttp
-import json
 import gzip
 import uuid
+import zlib
 import struct
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+# zlib解压gzip格式数据，跳过gzip模块的Python包装层
+_GZIP_WBITS = 31
+
+# 响应的4字节头 / seq(有符号) + payload size(无符号)
+_HDR = struct.Struct('>BBBB')
+_SEQ_SIZE = struct.Struct('>iI')
+# 请求头: full client request + json + gzip，后接payload size(无符号)
+_DEFAULT_HEADER = b'\x11\x10\x11\x00'
+_PAYLOAD_SIZE = struct.Struct('>I')
+
 class TTSClient:
     def __init__(self, appid: str, token: str, cluster: str, voice_type: str, session: aiohttp.ClientSession):
         self.appid = appid
@@ -16,16 +28,22 @@ class TTSClient:
         self.session = session
         self.url = "wss://openspeech.bytedance.com/api/v1/tts/ws_binary"
         self.ws = None
+        self._request_template = self._build_request_template()
 
-    def _build_request(self, text: str) -> bytes:
-        default_header = bytearray(b'\x11\x10\x11\x00')
+    def _build_request_template(self) -> bytes:
+        """预先序列化请求体，每次请求只替换uid/reqid/text"""
+        # 使用随机占位符，避免与合成文本冲突
+        marker = uuid.uuid4().hex
+        self._uid_placeholder = orjson.dumps(f"__uid_{marker}__")
+        self._reqid_placeholder = orjson.dumps(f"__reqid_{marker}__")
+        self._text_placeholder = orjson.dumps(f"__text_{marker}__")
         request_json = {
             "app": {
                 "appid": self.appid,
                 "token": "access_token",
                 "cluster": self.cluster
             },
-            "user": {"uid": str(uuid.uuid4())},
+            "user": {"uid": f"__uid_{marker}__"},
             "audio": {
                 "voice_type": self.voice_type,
                 "encoding": "pcm",
@@ -35,46 +53,54 @@ class TTSClient:
                 "pitch_ratio": 1.0
             },
             "request": {
-                "reqid": str(uuid.uuid4()),
-                "text": text,
+                "reqid": f"__reqid_{marker}__",
+                "text": f"__text_{marker}__",
                 "text_type": "plain",
                 "operation": "submit"
             }
         }
+        return orjson.dumps(request_json)
+
+    def _build_request(self, text: str) -> bytes:
+        payload_bytes = self._request_template \
+            .replace(self._uid_placeholder, orjson.dumps(str(uuid.uuid4()))) \
+            .replace(self._reqid_placeholder, orjson.dumps(str(uuid.uuid4()))) \
+            .replace(self._text_placeholder, orjson.dumps(text))
         logger.info(f"TTS参数: voice_type={self.voice_type}, cluster={self.cluster}")
-        payload_bytes = json.dumps(request_json).encode('utf-8')
-        payload_bytes = gzip.compress(payload_bytes)
-        full_request = bytearray(default_header)
-        full_request.extend((len(payload_bytes)).to_bytes(4, 'big'))
-        full_request.extend(payload_bytes)
-        return bytes(full_request)
+        payload_bytes = gzip.compress(payload_bytes, compresslevel=1)
+        return b''.join((_DEFAULT_HEADER, _PAYLOAD_SIZE.pack(len(payload_bytes)), payload_bytes))
 
     def _parse_response(self, res: bytes):
-        header_size = res[0] & 0x0f
-        message_type = res[1] >> 4
-        message_type_specific_flags = res[1] & 0x0f
-        message_compression = res[2] & 0x0f
-        payload = res[header_size*4:]
+        b0, b1, b2, _ = _HDR.unpack_from(res, 0)
+        message_type = b1 >> 4
+        message_type_specific_flags = b1 & 0x0f
+        message_compression = b2 & 0x0f
+        # 协议固定为4字节头(header_size=1)，其他取值按声明长度兼容处理
+        offset = 4
+        if b0 & 0x0f != 1:
+            logger.warning(f"TTS响应头长度异常: header_size={b0 & 0x0f}")
+            offset = (b0 & 0x0f) * 4
+        # memoryview切片不复制数据
+        mv = memoryview(res)
         
         if message_type == 0xb:
             if message_type_specific_flags == 0:
                 return None, False
-            sequence_number = int.from_bytes(payload[:4], "big", signed=True)
-            payload_size = int.from_bytes(payload[4:8], "big", signed=False)
-            audio_data = payload[8:]
+            sequence_number, payload_size = _SEQ_SIZE.unpack_from(res, offset)
+            audio_data = mv[offset+8:]
             
             if len(audio_data) != payload_size:
                 logger.warning(f"TTS音频大小不匹配: 声明{payload_size}, 实际{len(audio_data)}")
             
             return audio_data, sequence_number < 0
         elif message_type == 0xf:
-            error_msg = payload[8:]
+            error_msg = mv[offset+8:]
             if message_compression == 1:
-                error_msg = gzip.decompress(error_msg)
-            logger.error(f"TTS error: {error_msg.decode('utf-8')}")
+                error_msg = zlib.decompress(error_msg, wbits=_GZIP_WBITS)
+            logger.error(f"TTS error: {str(error_msg, 'utf-8')}")
             return None, True
         elif message_type == 0xc:
-            logger.info(f"TTS frontend message: {payload}")
+            logger.info(f"TTS frontend message: {bytes(mv[offset:])}")
             return None, False
         return None, False
 